@@ -1,24 +1,55 @@
+import asyncio
+import atexit
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from functools import cache
+from pathlib import Path
+
+import aiohttp
 import dash
 from dash import dcc, html
 from dash.dependencies import Input, Output, State
 import feedparser
-from flask_caching import Cache
+from lxml import etree
+import orjson
+import plotly.io as pio
+import redis
 from urllib.parse import urlparse
+import xxhash
 
 # Initialize the Dash app
 app = dash.Dash(__name__, suppress_callback_exceptions=True, title="My Dash App")
 
 # Use base.html as the template
-app.index_string = open('./assets/base.html', 'r').read()
+@cache
+def _index():
+    # Relative to this file so the app can be started from any directory
+    return Path(__file__).parent.joinpath('assets/base.html').read_text(encoding='utf-8')
+
+app.index_string = _index()
 
 server = app.server
 
-# Initialize caching
-cache = Cache(app.server, config={
-    'CACHE_TYPE': 'filesystem',
-    'CACHE_DIR': '/tmp/cache-directory',
-    'CACHE_DEFAULT_TIMEOUT': 300  # Cache timeout in seconds (5 minutes)
-})
+# Dash serializes callback responses (including dcc.Store data) through plotly's JSON
+# encoder; pin it to orjson instead of letting it fall back to the stdlib json module
+pio.json.config.default_engine = 'orjson'
+
+# Initialize caching: an in-process dict checked first, then Redis shared by all workers
+CACHE_TIMEOUT = 300  # Cache timeout in seconds (5 minutes)
+redis_client = redis.Redis.from_url(
+    os.getenv('REDIS_URL', 'redis://localhost:6379/0'),
+    socket_timeout=1,
+    socket_connect_timeout=1
+)
+REDIS_RETRY_INTERVAL = 60  # Skip Redis for a minute after it was unreachable
+_redis_down_until = 0.0
+_redis_down_lock = threading.Lock()
+REFRESH_INTERVAL = 240  # Refresh the cache in the background before it expires
+FETCH_TIMEOUT = 15  # Longest a callback waits for the feeds, in seconds
+FEED_STATE_TIMEOUT = 86400  # Keep feed ETags for a day to send conditional requests
+_MEM_CACHE = {}  # (category, article_count) -> (fetched_at, articles)
 
 # Define RSS feeds for Cybersecurity News and General World News
 RSS_FEEDS = {
@@ -37,6 +68,9 @@ RSS_FEEDS = {
     ]
 }
 
+# Source name shown for each feed, taken from the domain of its URL
+_DOMAIN = {u: urlparse(u).netloc.removeprefix('www.') for us in RSS_FEEDS.values() for u in us}
+
 # Prompts for generating social media content
 prompts = {
     'satirical': """
@@ -70,38 +104,360 @@ Keep it concise and actionable in 280 characters or less.
 """
 }
 
-# Default number of articles to fetch
+# Prompts followed by the blank line that separates them from the articles
+_PROMPT_PREFIX = {k: v + "\n\n" for k, v in prompts.items()}
+
+# Default and maximum number of articles to fetch per feed
 default_article_count = 3
+max_article_count = 20
+
+# Largest feed body we accept, in bytes
+MAX_FEED_SIZE = 2_000_000
+
+# Element paths of the fields we read, per feed format (keyed by the root tag)
+_ATOM = "{http://www.w3.org/2005/Atom}"
+_RSS1 = "{http://purl.org/rss/1.0/}"
+_DC = "{http://purl.org/dc/elements/1.1/}"
+_CONTENT = "{http://purl.org/rss/1.0/modules/content/}"
+FEED_FORMATS = {
+    "rss": ("channel/item", "title", "description", "link", "pubDate"),
+    "{http://www.w3.org/1999/02/22-rdf-syntax-ns#}RDF": (
+        f"{_RSS1}item", f"{_RSS1}title", f"{_RSS1}description", f"{_RSS1}link", f"{_DC}date"
+    ),
+    f"{_ATOM}feed": (
+        f"{_ATOM}entry", f"{_ATOM}title", f"{_ATOM}summary", f"{_ATOM}link", f"{_ATOM}published"
+    ),
+}
+
+# Event loop running in a daemon thread, so it also works under gunicorn's sync workers.
+# All downloads run on it and share one aiohttp session (see _session).
+_LOOP = None
+_LOOP_LOCK = threading.Lock()
+_SESSION = None
+
+def _loop():
+    # Started on first use rather than at import, so importing app.py has no side effects
+    global _LOOP
+    with _LOOP_LOCK:
+        if _LOOP is None:
+            _LOOP = asyncio.new_event_loop()
+            threading.Thread(target=_LOOP.run_forever, daemon=True, name="rss-loop").start()
+    return _LOOP
+
+# Worker threads for feed parsing, which is blocking and would stall the event loop
+parse_executor = ThreadPoolExecutor(max_workers=len(RSS_FEEDS['cybersecurity']))
+
+def _redis_call(action, func, *args, default=None, **kwargs):
+    # Redis is optional: when it's unreachable, log it once and leave it alone for
+    # REDIS_RETRY_INTERVAL seconds instead of failing (and logging) on every call
+    global _redis_down_until
+    if time.time() < _redis_down_until:
+        return default
+    try:
+        return func(*args, **kwargs)
+    except (redis.ConnectionError, redis.TimeoutError) as e:
+        with _redis_down_lock:
+            already_down = time.time() < _redis_down_until
+            _redis_down_until = time.time() + REDIS_RETRY_INTERVAL
+        if not already_down:
+            print(f"Redis is unavailable, using the in-process cache for {REDIS_RETRY_INTERVAL}s: {e}")
+    except redis.RedisError as e:
+        print(f"Error {action} Redis: {e}")
+    return default
+
+def _redis_get(key):
+    return _redis_call(f"reading {key} from", redis_client.get, key)
+
+def _redis_setex(key, timeout, value):
+    _redis_call(f"writing {key} to", redis_client.setex, key, timeout, value)
+
+def _load_feed_states(feeds):
+    # ETag, Last-Modified, body hash and parsed articles of each feed from its last download
+    values = _redis_call(
+        "reading feed states from", redis_client.mget, [f"feed:{url}" for url in feeds], default=[]
+    )
+    return {url: orjson.loads(value) for url, value in zip(feeds, values) if value is not None}
+
+def _save_feed_states(states):
+    pipe = redis_client.pipeline()
+    for url, state in states.items():
+        pipe.setex(f"feed:{url}", FEED_STATE_TIMEOUT, orjson.dumps(state))
+    _redis_call("writing feed states to", pipe.execute)
+
+def _text(element, path, default):
+    # All text inside the element, so Atom type="xhtml" content (wrapped in a <div>) is read too
+    child = element.find(path)
+    value = "".join(child.itertext()).strip() if child is not None else ""
+    return value or default
+
+def _atom_link(entry):
+    # A link without rel is an alternate link (RFC 4287); prefer it over self/edit links
+    links = entry.findall(f"{_ATOM}link")
+    for link in links:
+        if link.get("rel") in (None, "", "alternate"):
+            return link.get("href")
+    return links[0].get("href") if links else None
+
+def _rss_link(item):
+    # Items without <link> can use a permalink <guid> instead
+    link = _text(item, "link", None)
+    guid = item.find("guid")
+    if link is None and guid is not None and guid.get("isPermaLink", "true") != "false":
+        link = _text(item, "guid", None)
+    return link
+
+def _parse_with_lxml(body, domain):
+    # Read only the fields we need straight from the XML, skipping feedparser's
+    # sanitizing and normalization
+    parser = etree.XMLParser(resolve_entities=False, no_network=True)
+    root = etree.fromstring(body, parser)
+    if root.tag not in FEED_FORMATS:
+        raise ValueError(f"Unknown feed format {root.tag}")
+    items, title, summary, link, published = FEED_FORMATS[root.tag]
 
-@cache.memoize()
-def fetch_rss_data(category, article_count):
     articles = []
+    for item in root.iterfind(items):
+        item_summary = _text(item, summary, None)
+        if root.tag == f"{_ATOM}feed":
+            item_link = _atom_link(item)
+            if item_summary is None:
+                item_summary = _text(item, f"{_ATOM}content", None)
+        else:
+            item_link = _rss_link(item) if root.tag == "rss" else _text(item, link, None)
+            # Like feedparser, use <content:encoded> when there is no <description>
+            if item_summary is None:
+                item_summary = _text(item, f"{_CONTENT}encoded", None)
+        articles.append({
+            "title": _text(item, title, "No Title"),
+            "summary": item_summary or "No Description",
+            "link": item_link or "No URL",
+            "published": _text(item, published, "Unknown Date"),
+            "source": domain
+        })
+    return articles
+
+def _parse_feed(body, domain):
+    try:
+        return _parse_with_lxml(body, domain)
+    except (etree.LxmlError, ValueError) as e:
+        print(f"Falling back to feedparser for {domain}: {e}")
+
+    # feedparser copes with malformed feeds the strict XML parser rejects
+    feed = feedparser.parse(body, sanitize_html=False, resolve_relative_uris=False)
+
+    # Plain dict lookups skip FeedParserDict's key aliasing, so use the keys
+    # feedparser stores (<description> is stored as "summary")
+    get = dict.get
+    return [
+        {
+            "title": get(entry, "title", "No Title"),
+            "summary": get(entry, "summary", "No Description"),
+            "link": get(entry, "link") or get(entry, "id") or "No URL",
+            "published": get(entry, "published", "Unknown Date"),
+            "source": domain
+        }
+        for entry in feed.entries
+    ]
+
+async def _read_capped(response, url):
+    # Refuse oversized feeds instead of holding them in memory. The decompressed size
+    # is checked while reading, as Content-Length only covers the compressed body.
+    if int(response.headers.get("Content-Length", "0")) > MAX_FEED_SIZE:
+        raise ValueError(f"Feed {url} is larger than {MAX_FEED_SIZE} bytes")
+    body = bytearray()
+    async for chunk in response.content.iter_chunked(65536):
+        body += chunk
+        if len(body) > MAX_FEED_SIZE:
+            raise ValueError(f"Feed {url} is larger than {MAX_FEED_SIZE} bytes")
+    return bytes(body)
+
+async def _fetch_one(session, url, state):
+    domain = _DOMAIN[url]
+
+    # Ask the server to skip the body if the feed hasn't changed since the last download.
+    # aiohttp decompresses gzip/deflate bodies transparently.
+    headers = {"Accept-Encoding": "gzip, deflate"}
+    if state:
+        if state["etag"]:
+            headers["If-None-Match"] = state["etag"]
+        if state["last_modified"]:
+            headers["If-Modified-Since"] = state["last_modified"]
+
+    async with session.get(url, headers=headers, timeout=aiohttp.ClientTimeout(total=5)) as response:
+        if response.status == 304 and state:
+            return state
+        # Error pages are skipped like network errors instead of being stored as the feed
+        response.raise_for_status()
+        body = await _read_capped(response, url)
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+
+    # Servers that ignore conditional requests often resend the same body; reuse its
+    # articles (possibly parsed by another worker) instead of parsing it again
+    body_hash = xxhash.xxh64_hexdigest(body)
+    if state and state.get("hash") == body_hash:
+        articles = state["articles"]
+    else:
+        # Parsing runs in a worker thread so other feeds keep downloading meanwhile
+        loop = asyncio.get_running_loop()
+        articles = await loop.run_in_executor(parse_executor, _parse_feed, body, domain)
+
+    return {"etag": etag, "last_modified": last_modified, "hash": body_hash, "articles": articles}
+
+async def _session():
+    # One session for the life of the process keeps connections (and their TLS
+    # handshakes) and DNS lookups alive between fetches
+    global _SESSION
+    if _SESSION is None:
+        _SESSION = aiohttp.ClientSession(connector=aiohttp.TCPConnector(
+            limit=32,
+            ttl_dns_cache=600,
+            keepalive_timeout=60
+        ))
+    return _SESSION
+
+@atexit.register
+def _close_session():
+    if _SESSION is not None:
+        asyncio.run_coroutine_threadsafe(_SESSION.close(), _loop()).result(timeout=5)
+
+async def _in_thread(func, *args):
+    # redis-py calls block; run them in a thread so a slow Redis doesn't stall
+    # every download sharing the event loop
+    return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+async def _fetch_feeds(feeds):
+    states = await _in_thread(_load_feed_states, feeds)
+
+    # Download all feeds concurrently so latency is the slowest feed, not the sum
+    session = await _session()
+    results = await asyncio.gather(
+        *[_fetch_one(session, url, states.get(url)) for url in feeds],
+        return_exceptions=True
+    )
+
+    feed_articles = []
+    new_states = {}
+    for url, result in zip(feeds, results):
+        if isinstance(result, Exception):
+            print(f"Error fetching or parsing feed {url}: {result}")
+            if url in states:
+                # Keep serving the articles of the last good download
+                feed_articles.append(states[url]["articles"])
+            continue  # Skip this feed and continue with others
+        new_states[url] = result
+        feed_articles.append(result["articles"])
+
+    await _in_thread(_save_feed_states, new_states)
+    return feed_articles
+
+def _first_articles(feed_articles, article_count):
+    return [article for articles in feed_articles for article in articles[:article_count]]
+
+async def _fetch_all(feeds, article_count):
+    return _first_articles(await _fetch_feeds(feeds), article_count)
+
+def _store_articles(category, article_count, articles, fetched_at):
+    pipe = redis_client.pipeline()
+    pipe.setex(f"rss:{category}:{article_count}", CACHE_TIMEOUT, orjson.dumps({
+        "fetched_at": fetched_at,
+        "articles": articles
+    }))
+    # Remember the requested count so whichever worker refreshes the category refreshes it too
+    pipe.sadd(f"rss:counts:{category}", article_count)
+    _redis_call(f"writing {category} articles to", pipe.execute)
+    _MEM_CACHE[(category, article_count)] = (fetched_at, articles)
+
+def fetch_rss_data(category, article_count):
     feeds = RSS_FEEDS.get(category)
     if not feeds:
-        return articles  # Return empty list if category not found
+        return []  # Return empty list if category not found
 
-    for url in feeds:
-        try:
-            # Extract domain name from URL for the source name
-            domain = urlparse(url).netloc.replace('www.', '')
-            feed = feedparser.parse(url)
-
-            for entry in feed.entries[:article_count]:
-                articles.append({
-                    "title": entry.get("title", "No Title"),
-                    "summary": entry.get("description", "No Description"),
-                    "link": entry.link,
-                    "published": entry.get("published", "Unknown Date"),
-                    "source": domain
-                })
-        except Exception as e:
-            print(f"Error fetching or parsing feed {url}: {e}")
-            continue  # Skip this feed and continue with others
+    cached = _MEM_CACHE.get((category, article_count))
+    if cached and time.time() - cached[0] < CACHE_TIMEOUT:
+        return cached[1]
+
+    # Another worker may already have fetched this category
+    data = _redis_get(f"rss:{category}:{article_count}")
+    if data is not None:
+        # Keep the original fetch time so both tiers expire together
+        cached = orjson.loads(data)
+        _MEM_CACHE[(category, article_count)] = (cached["fetched_at"], cached["articles"])
+        return cached["articles"]
+
+    future = asyncio.run_coroutine_threadsafe(_fetch_all(feeds, article_count), _loop())
+    try:
+        articles = future.result(timeout=FETCH_TIMEOUT)
+    except FutureTimeoutError:
+        future.cancel()
+        print(f"Timed out fetching {category} feeds after {FETCH_TIMEOUT}s")
+        return cached[1] if cached else []  # Serve expired articles rather than nothing
+    _store_articles(category, article_count, articles, time.time())
     return articles
 
-# Layout of the Dash app
-app.layout = html.Div([
-    dcc.Store(id='stored-content'),  # Store for content to be copied
+def _requested_counts(category):
+    # Article counts requested in any worker (from Redis) or in this one, plus the default
+    counts = _redis_call(
+        f"reading {category} article counts from", redis_client.smembers,
+        f"rss:counts:{category}", default=set()
+    )
+    return (
+        {int(count) for count in counts}
+        | {count for key_category, count in list(_MEM_CACHE) if key_category == category}
+        | {default_article_count}
+    )
+
+def _lock_refresh(category):
+    # Only one worker refreshes a category per interval, the others read it from Redis.
+    # Without Redis every worker refreshes its own cache.
+    return _redis_call(
+        f"locking refresh of {category} in", redis_client.set,
+        f"refresh:{category}", 1, nx=True, ex=REFRESH_INTERVAL, default=True
+    )
+
+def _store_refreshed(category, feed_articles, fetched_at):
+    for article_count in _requested_counts(category):
+        articles = _first_articles(feed_articles, article_count)
+        _store_articles(category, article_count, articles, fetched_at)
+
+async def _refresher():
+    while True:
+        # Cached articles are refreshed before they expire
+        await asyncio.sleep(REFRESH_INTERVAL)
+
+        for category, feeds in RSS_FEEDS.items():
+            if not await _in_thread(_lock_refresh, category):
+                continue
+
+            try:
+                feed_articles = await _fetch_feeds(feeds)
+            except Exception as e:
+                print(f"Error refreshing {category}: {e}")
+                continue
+            if not any(feed_articles):
+                continue  # Keep serving the cached articles while every feed is failing
+            await _in_thread(_store_refreshed, category, feed_articles, time.time())
+
+def start_refresher():
+    # Called by the server entry points (__main__ below and gunicorn.conf.py), not on import
+    return asyncio.run_coroutine_threadsafe(_refresher(), _loop())
+
+# Dropdown options, built once at import
+_CATEGORY_OPTIONS = (
+    {'label': 'Cybersecurity News', 'value': 'cybersecurity'},
+    {'label': 'General World News', 'value': 'general'}
+)
+_PROMPT_OPTIONS = (
+    {'label': 'Satirical Post', 'value': 'satirical'},
+    {'label': 'Serious Post', 'value': 'serious'},
+    {'label': 'Breaking News Post', 'value': 'breaking_news'},
+    {'label': 'Trending Post', 'value': 'trend_summary'},
+    {'label': 'News Essay Post', 'value': 'news_essay'}
+)
+
+# Layout of the Dash app, built once and shared by every page load
+_LAYOUT = html.Div([
+    dcc.Store(id='stored-content'),  # Store for the prompt and articles of the post
 
     html.H1("Interactive News Fetcher"),
 
@@ -109,10 +465,7 @@ app.layout = html.Div([
         html.Label("Select news category:"),
         dcc.Dropdown(
             id="news-category",
-            options=[
-                {'label': 'Cybersecurity News', 'value': 'cybersecurity'},
-                {'label': 'General World News', 'value': 'general'}
-            ],
+            options=_CATEGORY_OPTIONS,
             value='cybersecurity',
             clearable=False
         ),
@@ -133,13 +486,7 @@ app.layout = html.Div([
         html.Label("Select prompt type:"),
         dcc.Dropdown(
             id="prompt-type",
-            options=[
-                {'label': 'Satirical Post', 'value': 'satirical'},
-                {'label': 'Serious Post', 'value': 'serious'},
-                {'label': 'Breaking News Post', 'value': 'breaking_news'},
-                {'label': 'Trending Post', 'value': 'trend_summary'},
-                {'label': 'News Essay Post', 'value': 'news_essay'}
-            ],
+            options=_PROMPT_OPTIONS,
             value='news_essay',
             clearable=False
         ),
@@ -156,10 +503,12 @@ app.layout = html.Div([
     html.Div(id='copy-status', style={'margin-top': '10px'})
 ])
 
+app.layout = _LAYOUT
+
 # Callback to update the news content when the user clicks the submit button
 @app.callback(
     Output("news-content", "children"),
-    Output('stored-content', 'data'),  # Store the generated content for copying
+    Output('stored-content', 'data'),  # Store the prompt and articles for rendering and copying
     [Input('submit-button', 'n_clicks')],
     [State('news-category', 'value'),
      State('article-count', 'value'),
@@ -174,6 +523,10 @@ def update_news(n_clicks, selected_category, article_count, selected_prompt_type
                 article_count = default_article_count
         except (ValueError, TypeError):
             article_count = default_article_count
+        article_count = min(article_count, max_article_count)
+
+        if selected_category not in RSS_FEEDS:
+            return html.Div("Unknown category."), None
 
         articles = fetch_rss_data(selected_category, article_count)
 
@@ -181,44 +534,53 @@ def update_news(n_clicks, selected_category, article_count, selected_prompt_type
             return html.Div("No articles found."), None
 
         # Get the correct prompt type
-        prompt = prompts.get(selected_prompt_type, prompts['serious'])
-
-        # Generate the article content
-        article_text = "\n".join([
-            f"**Title:** {article['title']}\n"
-            f"**Description:** {article['summary']}\n"
-            f"**Published:** {article['published']}\n"
-            f"**Source:** {article['source']}\n"
-            f"**URL:** {article['link']}\n"
-            for article in articles
-        ])
-
-        # Combine prompt and article content
-        combined_content = f"{prompt}\n\n{article_text}"
+        prompt = _PROMPT_PREFIX.get(selected_prompt_type, _PROMPT_PREFIX['serious'])
 
+        # The post text is built in the browser (formatPost in assets/app.js)
         return html.Div([
             html.H2("Generated Social Media Post"),
-            html.Pre(combined_content, style={
+            dcc.Markdown(id='post-md', style={
+                'whiteSpace': 'pre-wrap',
                 'wordWrap': 'break-word',
                 'overflowX': 'auto'
             })
-        ]), combined_content  # Return content to be stored in `dcc.Store`
+        ]), {"prompt": prompt, "articles": articles}  # Return content to be stored in `dcc.Store`
     
     return html.Div("Click 'Fetch Articles' to view news."), None
 
 
+# Callback to render the stored articles into the post
+app.clientside_callback(
+    """
+    function(data) {
+        return data ? formatPost(data) : "";
+    }
+    """,
+    Output('post-md', 'children'),
+    [Input('stored-content', 'data')]
+)
+
 # Callback to copy content to clipboard
 app.clientside_callback(
     """
-    function(n_clicks, content) {
-        if (n_clicks > 0 && content) {
+    function(n_clicks, data) {
+        if (n_clicks > 0 && data) {
+            const content = formatPost(data);
+            if (navigator.clipboard) {
+                // Dash waits for the promise, so the status reflects whether the write worked
+                return navigator.clipboard.writeText(content).then(
+                    () => "Content copied!",
+                    () => "Copy failed"
+                );
+            }
+            // The Clipboard API is only available on HTTPS or localhost
             const el = document.createElement('textarea');
             el.value = content;
             document.body.appendChild(el);
             el.select();
-            document.execCommand('copy');
+            const copied = document.execCommand('copy');
             document.body.removeChild(el);
-            return "Content copied!";
+            return copied ? "Content copied!" : "Copy failed";
         }
         return "";
     }
@@ -230,4 +592,12 @@ app.clientside_callback(
 
 # Run the Dash app
 if __name__ == "__main__":
-    app.run_server(host='0.0.0.0', port=5000, debug=True)
+    # Debug mode (reloader and debugger) only with DASH_DEBUG=1; use gunicorn in production
+    debug = os.getenv("DASH_DEBUG") == "1"
+
+    # Keep the article cache warm so callbacks don't wait for the feeds. Under the
+    # reloader, only the child process that serves requests runs the refresher.
+    if not debug or os.getenv("WERKZEUG_RUN_MAIN") == "true":
+        start_refresher()
+
+    app.run(host='0.0.0.0', port=5000, debug=debug)
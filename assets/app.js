@@ -6,4 +6,15 @@ document.addEventListener('DOMContentLoaded', function() {
             alert(`You clicked on ${item.textContent}`);
         });
     });
-});
\ No newline at end of file
+});
+
+// Builds the social media post from the prompt and articles kept in the `stored-content` store
+function formatPost(data) {
+    return data.prompt + data.articles.map(article =>
+        `**Title:** ${article.title}\n` +
+        `**Description:** ${article.summary}\n` +
+        `**Published:** ${article.published}\n` +
+        `**Source:** ${article.source}\n` +
+        `**URL:** ${article.link}\n`
+    ).join('\n');
+}
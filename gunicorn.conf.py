@@ -0,0 +1,6 @@
+# Gunicorn settings, loaded automatically when gunicorn is started from this directory
+
+def post_worker_init(worker):
+    # Each worker keeps its article cache warm with a background refresh
+    from app import start_refresher
+    start_refresher()